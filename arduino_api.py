@@ -1,4 +1,8 @@
+import asyncio
 import os.path
+import re
+import time
+from datetime import datetime, timezone
 from fastmcp import FastMCP
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
@@ -15,14 +19,25 @@ SCOPES = ['https://www.googleapis.com/auth/documents.readonly']
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 CREDENTIALS_PATH = os.path.join(BASE_DIR, 'credentials.json')
 TOKEN_PATH = os.path.join(BASE_DIR, 'token.json')
+DOC_CACHE_TTL = 300  # 秒：TTL 内直接使用内存中的文档，不请求 API
+TOKEN_REFRESH_MARGIN = 60  # 秒：令牌剩余有效期低于该值时才刷新
 
+# 进程内只创建一次的凭据和客户端，避免每次调用都重新授权、重建连接
+_creds = None
+_docs_service = None
+_gdoc_lock = asyncio.Lock()
+# 按 revisionId 缓存文档内容，文档未修改时直接复用
+_doc_cache = {"content": None, "ts": 0, "rev": None}
+# 章节索引，随 _doc_cache["content"] 一起失效
+_topic_index = {"content": None}
 
-async def get_gdoc_service():
-    """处理授权并返回 Google Docs API 客户端"""
+
+def load_credentials():
+    """处理授权并返回凭据（同步 I/O，不要在事件循环中直接调用）"""
     creds = None
     # token.json 存储用户的访问和刷新令牌
-    if os.path.exists('token.json'):
-        creds = Credentials.from_authorized_user_file('token.json', SCOPES)
+    if os.path.exists(TOKEN_PATH):
+        creds = Credentials.from_authorized_user_file(TOKEN_PATH, SCOPES)
     
     # 如果没有可用的凭据，让用户登录
     if not creds or not creds.valid:
@@ -30,13 +45,152 @@ async def get_gdoc_service():
             creds.refresh(Request())
         else:
             # 确保你目录下有 credentials.json 文件
-            flow = InstalledAppFlow.from_client_secrets_file('credentials.json', SCOPES)
+            flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_PATH, SCOPES)
             creds = flow.run_local_server(port=0)
         # 保存凭据以便下次使用
-        with open('token.json', 'w') as token:
+        with open(TOKEN_PATH, 'w') as token:
             token.write(creds.to_json())
     
-    return build('docs', 'v1', credentials=creds)
+    return creds
+
+
+def init_gdoc_service():
+    """创建并缓存 Google Docs API 客户端"""
+    global _creds, _docs_service
+    if _docs_service is None:
+        _creds = load_credentials()
+        _docs_service = build('docs', 'v1', credentials=_creds)
+    return _docs_service
+
+
+def token_expiring(creds) -> bool:
+    """令牌已过期或即将过期（google-auth 的 expiry 为 naive UTC 时间）"""
+    if creds.expired:
+        return True
+    if creds.expiry is None:
+        return False
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    return (creds.expiry - now).total_seconds() < TOKEN_REFRESH_MARGIN
+
+
+async def get_gdoc_service():
+    """返回缓存的 Google Docs API 客户端，阻塞的授权/刷新放到线程中执行"""
+    if _docs_service is None:
+        return await asyncio.to_thread(init_gdoc_service)
+    if _creds.refresh_token and token_expiring(_creds):
+        await asyncio.to_thread(_creds.refresh, Request())
+    return _docs_service
+
+
+async def get_doc_content():
+    """获取文档 body.content；TTL 内或 revisionId 未变化时直接返回内存缓存"""
+    async with _gdoc_lock:
+        if _doc_cache["content"] is not None and time.time() - _doc_cache["ts"] < DOC_CACHE_TTL:
+            return _doc_cache["content"]
+
+        service = await get_gdoc_service()
+        meta = await asyncio.to_thread(
+            lambda: service.documents().get(documentId=DOCUMENT_ID, fields='revisionId').execute())
+        if _doc_cache["content"] is None or meta.get('revisionId') != _doc_cache["rev"]:
+            doc = await asyncio.to_thread(
+                lambda: service.documents().get(documentId=DOCUMENT_ID).execute())
+            _doc_cache["content"] = doc.get('body').get('content')
+            _doc_cache["rev"] = doc.get('revisionId')
+        _doc_cache["ts"] = time.time()
+        return _doc_cache["content"]
+
+
+def heading_level(style: str):
+    """TITLE 为 0，HEADING_n 为 n，正文返回 None"""
+    if style == 'TITLE':
+        return 0
+    if style.startswith('HEADING_'):
+        return int(style.rsplit('_', 1)[1])
+    return None
+
+
+def build_topic_index(content) -> dict:
+    """遍历一次文档，按标题切分章节，并建立 标题 / 标题词 -> 章节序号 的索引"""
+    preview = []
+    lines = []
+    headings = []  # [(行号, 标题级别, 标题)]
+
+    for element in content:
+        if 'paragraph' not in element:
+            continue
+        paragraph = element['paragraph']
+        text_line = "".join(el.get('textRun', {}).get('content', '')
+                            for el in paragraph['elements'])
+        if len(preview) < 100:
+            preview.append(text_line)
+
+        # 以 Docs 的标题样式作为章节边界
+        level = heading_level(paragraph.get('paragraphStyle', {}).get('namedStyleType', ''))
+        if level is not None:
+            headings.append((len(lines), level, text_line.strip()))
+        lines.append(text_line)
+
+    # 章节延续到下一个同级或更高级标题，因此大章节包含其下的小节
+    ends = [len(lines)] * len(headings)
+    open_headings = []
+    for i, (start, level, _) in enumerate(headings):
+        while open_headings and headings[open_headings[-1]][1] >= level:
+            ends[open_headings.pop()] = start
+        open_headings.append(i)
+
+    sections = []  # [(heading_lower, text, body_lower)]，body 只到下一个任意标题
+    first = headings[0][0] if headings else len(lines)
+    if first:
+        text = "".join(lines[:first])
+        sections.append(("", text, text.lower()))
+    for i, (start, _, heading) in enumerate(headings):
+        body_end = headings[i + 1][0] if i + 1 < len(headings) else len(lines)
+        sections.append((heading.lower(), "".join(lines[start:ends[i]]),
+                         "".join(lines[start:body_end]).lower()))
+
+    by_heading = {}
+    by_word = {}
+    for idx, (heading_lower, _, _) in enumerate(sections):
+        by_heading.setdefault(heading_lower, idx)
+        for word in set(re.findall(r"\w+", heading_lower)):
+            by_word.setdefault(word, []).append(idx)
+
+    return {
+        "sections": sections,
+        "by_heading": by_heading,
+        "by_word": by_word,
+        "preview": "".join(preview),
+    }
+
+
+async def get_topic_index() -> dict:
+    """返回当前文档的章节索引，文档内容变化时重建"""
+    content = await get_doc_content()
+    if _topic_index["content"] is not content:
+        _topic_index.update(build_topic_index(content), content=content)
+    return _topic_index
+
+
+def find_topic_section(index: dict, topic: str):
+    """标题精确匹配 -> 标题词交集 -> 正文线性扫描，返回章节全文或 None"""
+    sections = index["sections"]
+    topic_lower = topic.strip().lower()
+
+    idx = index["by_heading"].get(topic_lower)
+    if idx is None:
+        words = re.findall(r"\w+", topic_lower)
+        if words:
+            hits = set(index["by_word"].get(words[0], ()))
+            for word in words[1:]:
+                hits &= set(index["by_word"].get(word, ()))
+            if hits:
+                idx = min(hits)
+    if idx is None:
+        # 索引未命中时才退回线性扫描正文（只扫本节正文，命中最具体的小节）
+        idx = next((i for i, (_, _, body_lower) in enumerate(sections) if topic_lower in body_lower), None)
+
+    return sections[idx][1] if idx is not None else None
+
 
 @mcp.tool()
 async def get_analytics_knowledge(topic: str = "overview") -> str:
@@ -45,34 +199,10 @@ async def get_analytics_knowledge(topic: str = "overview") -> str:
     从 Arduino Analytics 文档中提取特定章节的详细解惑信息。
     """
     try:
-        service = get_gdoc_service()
-        doc = service.documents().get(documentId=DOCUMENT_ID).execute()
-        content = doc.get('body').get('content')
-        
-        # 提取全文并识别章节标题
-        full_text = []
-        target_content = []
-        found_topic = False
-        
-        for element in content:
-            if 'paragraph' in element:
-                parts = [el.get('textRun', {}).get('content', '') 
-                        for el in element['paragraph']['elements']]
-                text_line = "".join(parts)
-                
-                # 简单的章节匹配逻辑
-                if topic.lower() in text_line.lower():
-                    found_topic = True
-                
-                if found_topic:
-                    target_content.append(text_line)
-                    # 如果遇到下一个大标题，停止提取（假设章节由空行或特定格式分隔）
-                    if len(target_content) > 50: # 限制单次提取长度防止 token 溢出
-                        break
-                
-                full_text.append(text_line)
-
-        result = "".join(target_content) if found_topic else "".join(full_text[:100])
+        index = await get_topic_index()
+        section = find_topic_section(index, topic)
+
+        result = section if section is not None else index["preview"]
         return f"--- Arduino Analytics Ecosystem Doc Extract ---\n\n{result}"
 
     except Exception as e:
@@ -91,6 +221,7 @@ async def list_ecosystem_chapters() -> list:
 def main():
     # 第一次运行建议在终端执行 `python server.py` 进行授权
     # 授权成功后，再通过 Claude Desktop 启动
+    init_gdoc_service()
     mcp.run(transport="stdio")
 
 if __name__ == "__main__":
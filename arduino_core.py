@@ -0,0 +1,522 @@
+import os
+import functools
+import hashlib
+import logging
+import pickle
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import zipfile
+from typing import List, Dict, Optional, Tuple
+from lxml import etree, html
+from rapidfuzz import fuzz, process
+
+# --- Initialization ---
+logger = logging.getLogger(__name__)
+
+DOC_PATH = os.path.join(os.path.dirname(__file__), "Arduino - The Analytics Ecosytem playbook.docx")
+CACHE_PATH = DOC_PATH + ".idx.pkl"
+CACHE_SCHEMA_VERSION = 7
+FEEDBACK_LOG_PATH = os.path.join(os.path.dirname(__file__), "playbook_feedback.log")
+# opt-in: index via `pandoc -t gfm` when pandoc is installed, instead of the lxml stream parser
+USE_PANDOC = os.environ.get("ARDUINO_DOC_PANDOC", "") == "1"
+
+# WordprocessingML names used by the streaming parser
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+NSMAP = {"w": W_NS}
+W_BODY, W_P, W_TBL, W_SDT = (f"{{{W_NS}}}{tag}" for tag in ("body", "p", "tbl", "sdt"))
+W_T, W_TAB, W_BR, W_CR = (f"{{{W_NS}}}{tag}" for tag in ("t", "tab", "br", "cr"))
+W_VAL, W_TYPE = (f"{{{W_NS}}}{attr}" for attr in ("val", "type"))
+RUNS_XPATH = etree.XPath("./w:r | ./w:hyperlink/w:r", namespaces=NSMAP)
+
+# Markdown blocks produced by pandoc
+MD_HEADING_RE = re.compile(r"(#{1,6}) +(.+)")
+MD_IMAGE_RE = re.compile(r"!\[[^\]]*\]\([^)]*\)(\{[^}]*\})?|<img [^>]*>")
+MD_LINK_RE = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+MD_HTML_TAG_RE = re.compile(r"</?(?:u|sub|sup|span|mark)\b[^>]*>")
+MD_EMPHASIS_RE = re.compile(r"(?<!\\)(?:\*+|~~)")
+MD_ESCAPE_RE = re.compile(r"\\([!-/:-@\[-`{-~])")
+MD_LIST_MARKER_RE = re.compile(r"^ *(?:[-*+]|\d+[.)]) +", re.MULTILINE)
+MD_TABLE_CELL_SEP_RE = re.compile(r"(?<!\\)\|")
+MD_TABLE_RULE_RE = re.compile(r" *:?-+:? *")
+
+SUBSTRING_MIN_LEN = 3  # shorter queries skip the substring fast paths and go through fuzzy scoring
+
+_knowledge_index = None
+_last_mtime = None
+_index_lock = threading.Lock()
+_search_choices = {}  # main_filters -> search snapshot of the current index, see get_search_choices
+_overview_cache = {"kb": None, "structure": None, "markdown": None}  # rebuilt when the index changes
+
+# Documentation issue reports for the Data Governance team.
+# The FileHandler keeps playbook_feedback.log open and serialises writes across threads.
+feedback_logger = logging.getLogger("playbook_feedback")
+if not feedback_logger.handlers:
+    _feedback_handler = logging.FileHandler(FEEDBACK_LOG_PATH, encoding="utf-8", delay=True)
+    _feedback_handler.setFormatter(logging.Formatter("%(message)s"))
+    feedback_logger.addHandler(_feedback_handler)
+    feedback_logger.setLevel(logging.INFO)
+    feedback_logger.propagate = False  # already echoed to stderr by the caller
+
+
+# --- Analysis functions ---
+def load_cached_index(header: Dict) -> Optional[List[Dict]]:
+    """Load the pickled index from disk if it was built from the same document"""
+    if not os.path.exists(CACHE_PATH):
+        return None
+    try:
+        with open(CACHE_PATH, "rb") as f:
+            if pickle.load(f) != header:
+                return None  # stale cache
+            return pickle.load(f)
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable index cache {CACHE_PATH}: {e}")
+        return None
+
+
+def save_cached_index(header: Dict, index: List[Dict]):
+    """Write header + index next to the document (atomic replace)"""
+    tmp_path = None
+    try:
+        # Unique temp name so the two servers never write the same file concurrently
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(CACHE_PATH),
+                                        prefix=os.path.basename(CACHE_PATH) + ".", suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(header, f, protocol=5)
+            pickle.dump(index, f, protocol=5)
+        os.replace(tmp_path, CACHE_PATH)
+    except Exception as e:
+        logger.warning(f"Could not write index cache {CACHE_PATH}: {e}")
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def build_knowledge_index():
+    """Make index with Heading"""
+    global _knowledge_index, _last_mtime
+
+    if not os.path.exists(DOC_PATH):
+        logger.error(f"Document not found at {DOC_PATH}")
+        return []
+    
+    # check file modification time
+    stat = os.stat(DOC_PATH)
+    if _knowledge_index is not None and _last_mtime == stat.st_mtime:
+        return _knowledge_index  # cache valid
+
+    # only one tool call parses; concurrent callers wait and reuse its result
+    with _index_lock:
+        if _knowledge_index is not None and _last_mtime == stat.st_mtime:
+            return _knowledge_index
+
+        with open(DOC_PATH, "rb") as f:
+            digest = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+        header = {
+            "schema_version": CACHE_SCHEMA_VERSION,
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "hash": digest,
+            "parser": "pandoc" if USE_PANDOC and shutil.which("pandoc") else "lxml",
+        }
+
+        index = load_cached_index(header)
+        if index is None:
+            if header["parser"] == "pandoc":
+                try:
+                    index = parse_document_pandoc()
+                except (OSError, subprocess.CalledProcessError, UnicodeDecodeError) as e:
+                    logger.warning(f"pandoc failed, falling back to the XML parser: {e}")
+            if index is None:
+                index = parse_document()
+            save_cached_index(header, index)  # keyed on the requested parser, so a fallback result is reused too
+
+        _knowledge_index = index
+        _last_mtime = stat.st_mtime
+        return _knowledge_index
+
+
+def make_section(main_topic: str, sub_topic: str, text: str) -> Dict:
+    """Index entry for one section"""
+    sub_topic_or_main = sub_topic or main_topic
+    return {
+        "main_topic": main_topic,
+        "sub_topic": sub_topic_or_main,
+        "content": text,
+        # lowercased once here so searches don't re-lowercase per query
+        "main_topic_lower": main_topic.lower(),
+        "sub_topic_lower": sub_topic_or_main.lower(),
+        "content_lower": text.lower(),
+        "search_key": f"{main_topic} {sub_topic}".lower(),
+    }
+
+
+def load_style_names(z: zipfile.ZipFile) -> Dict[str, str]:
+    """styleId -> lowercased style name (e.g. 'Heading1' -> 'heading 1')"""
+    try:
+        with z.open("word/styles.xml") as fp:
+            root = etree.parse(fp).getroot()
+    except KeyError:
+        return {}
+    return {
+        style.get(f"{{{W_NS}}}styleId"): name.get(W_VAL, "").lower()
+        for style in root.iterfind("w:style", NSMAP)
+        if (name := style.find("w:name", NSMAP)) is not None
+    }
+
+
+def paragraph_text(p) -> str:
+    """Text of a <w:p> from its runs and hyperlink runs, like python-docx Paragraph.text"""
+    parts = []
+    for r in RUNS_XPATH(p):
+        for child in r:
+            if child.tag == W_T:
+                parts.append(child.text or "")
+            elif child.tag == W_TAB:
+                parts.append("\t")
+            elif child.tag == W_CR or (child.tag == W_BR and child.get(W_TYPE, "textWrapping") == "textWrapping"):
+                parts.append("\n")  # page and column breaks carry no text
+    return "".join(parts)
+
+
+def first_run_bold(p) -> bool:
+    """Whether the first run of a <w:p> is explicitly bold"""
+    r = p.find("w:r", NSMAP)
+    b = r.find("w:rPr/w:b", NSMAP) if r is not None else None
+    return b is not None and b.get(W_VAL, "true") not in ("0", "false", "off")
+
+
+def parse_document() -> List[Dict]:
+    """Stream word/document.xml and split the body into sections by Heading"""
+    index = []
+    current_main_topic = "General Overview"
+    current_sub_topic = ""
+    current_content = []
+
+    # snapshot current section
+    def save_current_section():
+        if current_content:
+            text = "\n".join(current_content).strip()
+            if text:
+                index.append(make_section(current_main_topic, current_sub_topic, text))
+
+    with zipfile.ZipFile(DOC_PATH) as z:
+        style_names = load_style_names(z)
+        with z.open("word/document.xml") as fp:
+            for _, el in etree.iterparse(fp, events=("end",), tag=(W_P, W_TBL, W_SDT)):
+                body = el.getparent()
+                if body is None or body.tag != W_BODY:
+                    continue  # nested in a table / content control, handled with its parent
+
+                # <p> paragraph
+                if el.tag == W_P:
+                    text = paragraph_text(el).strip()
+                    if text:
+                        style_el = el.find("w:pPr/w:pStyle", NSMAP)
+                        style = style_names.get(style_el.get(W_VAL), "") if style_el is not None else ""
+                        # Big title (Heading 1)
+                        if style.startswith('heading 1'):
+                            save_current_section()
+                            current_main_topic = text
+                            current_sub_topic = ""
+                            current_content = []
+                        # Small title (Heading 2 or bold short line); run formatting only read for short lines
+                        elif style.startswith('heading') or (len(text) < 60 and first_run_bold(el)):
+                            save_current_section()
+                            current_sub_topic = text
+                            current_content = []
+                        else:
+                            current_content.append(text)
+
+                # <tbl> table
+                elif el.tag == W_TBL:
+                    current_content.append(parse_table_to_markdown(el))
+
+                # graph
+                elif el.find('.//w:drawing', NSMAP) is not None:
+                    img_context = current_sub_topic or "Unlabeled Section"
+                    current_content.append(f"\n> [Graph in this section: {img_context}] (Please search in original document)\n")
+
+                # keep memory flat: drop the handled element and everything before it
+                el.clear()
+                while el.getprevious() is not None:
+                    del body[0]
+
+    save_current_section()
+    return index
+
+
+def parse_document_pandoc() -> List[Dict]:
+    """Convert the docx to GitHub Markdown with pandoc and split it into sections by Heading"""
+    result = subprocess.run(
+        ["pandoc", "--from=docx", "--to=gfm", "--wrap=none", DOC_PATH],
+        capture_output=True, encoding="utf-8", check=True,
+    )
+    return split_markdown_sections(result.stdout)
+
+
+def split_markdown_sections(markdown: str) -> List[Dict]:
+    """Same sectioning as parse_document, over blank-line separated Markdown blocks"""
+    index = []
+    current_main_topic = "General Overview"
+    current_sub_topic = ""
+    current_content = []
+
+    # snapshot current section
+    def save_current_section():
+        if current_content:
+            text = "\n".join(current_content).strip()
+            if text:
+                index.append(make_section(current_main_topic, current_sub_topic, text))
+
+    for block in re.split(r"\n\s*\n", markdown):
+        block = block.strip()
+        if not block:
+            continue
+
+        heading = MD_HEADING_RE.fullmatch(block)
+        text = markdown_to_text(heading.group(2) if heading else block)
+        if not text:
+            continue  # image-only block, the XML parser drops it as an empty paragraph
+        # Big title (Heading 1)
+        if heading and len(heading.group(1)) == 1:
+            save_current_section()
+            current_main_topic = text
+            current_sub_topic = ""
+            current_content = []
+        # Small title (Heading 2 or short line starting bold, like first_run_bold)
+        elif heading or (block.startswith("**") and len(text) < 60):
+            save_current_section()
+            current_sub_topic = text
+            current_content = []
+        elif block.startswith("|"):
+            current_content.append(markdown_table_to_markdown(block))
+        elif block.startswith("<table>") and block.endswith("</table>"):
+            current_content.append(html_table_to_markdown(block))  # pandoc's fallback for merged cells
+        else:
+            current_content.append(text)
+
+    save_current_section()
+    return index
+
+
+def markdown_to_text(block: str) -> str:
+    """Plain text of a GFM block: inline markup, escapes and list markers removed, as paragraph_text sees it"""
+    text = block.replace("\\\n", "\n")  # hard line break
+    text = MD_LIST_MARKER_RE.sub("", text)
+    text = MD_IMAGE_RE.sub("", text)
+    text = MD_LINK_RE.sub(r"\1", text)
+    text = MD_HTML_TAG_RE.sub("", text)
+    text = MD_EMPHASIS_RE.sub("", text)
+    text = MD_ESCAPE_RE.sub(r"\1", text)
+    return "\n".join(line.strip() for line in text.split("\n")).strip()
+
+
+def markdown_table_to_markdown(block: str) -> str:
+    """Re-render a GFM pipe table with plain cells in the layout of parse_table_to_markdown"""
+    rows = []
+    for line in block.split("\n"):
+        cells = MD_TABLE_CELL_SEP_RE.split(line.strip().strip("|"))
+        if all(MD_TABLE_RULE_RE.fullmatch(cell) for cell in cells):
+            continue  # header separator, re-added by table_rows_to_markdown
+        rows.append([markdown_to_text(cell).replace("\n", " ") for cell in cells])
+    return table_rows_to_markdown(rows)
+
+
+def html_table_to_markdown(block: str) -> str:
+    """Re-render a pandoc HTML table, repeating spanned cells like parse_table_to_markdown"""
+    rows = []
+    below = {}  # grid column -> (text, rows left), repeated into the rows under a rowspan
+
+    def fill_spanned(cells):
+        while len(cells) in below:
+            text, left = below.pop(len(cells))
+            if left > 1:
+                below[len(cells)] = (text, left - 1)
+            cells.append(text)
+
+    for tr in html.fragment_fromstring(block).iter("tr"):
+        cells = []
+        for td in tr.iterchildren("th", "td"):
+            fill_spanned(cells)
+            text = " ".join(part.strip() for part in td.itertext() if part.strip())
+            rowspan = int(td.get("rowspan", 1))
+            for _ in range(int(td.get("colspan", 1))):
+                if rowspan > 1:
+                    below[len(cells)] = (text, rowspan - 1)
+                cells.append(text)
+        fill_spanned(cells)
+        rows.append(cells)
+    return table_rows_to_markdown(rows)
+
+
+def get_search_choices(main_filters: Tuple[str, ...] = ()):
+    """
+    Sections whose main_topic matches any of the (lowercased) main_filters, plus their
+    sub_topic / lowercased content lists for batch scoring. Each section appears once.
+    The snapshot is tied to one index build; its "search" is an LRU-cached scored_sections
+    bound to it, so cached positions always refer to the same items list.
+    """
+    kb = build_knowledge_index()
+    choices = _search_choices.get(main_filters)
+    if choices is None or choices["kb"] is not kb:
+        items = [item for item in kb
+                 if not main_filters or any(f in item['main_topic_lower'] for f in main_filters)]
+        choices = {
+            "kb": kb,
+            "items": items,
+            "sub_topics": [item['sub_topic'] for item in items],
+            "contents_lower": [item['content_lower'] for item in items],
+        }
+        choices["search"] = functools.lru_cache(maxsize=512)(functools.partial(scored_sections, choices))
+        _search_choices[main_filters] = choices
+    return choices
+
+
+def blended_scores(choices: Dict, query: str, title_hits: List[Tuple[int, float]]) -> List[Tuple[int, float]]:
+    """
+    (position, title(70%) + content(30%) score) above 40 for already title-scored positions,
+    best first. A content that contains the query scores 100 without running partial_ratio.
+    """
+    contents_lower = choices["contents_lower"]
+    query_lower = query.lower()
+    query_key = query_lower.strip()
+    content_scores = {}
+    fuzzy_contents = {}
+    for idx, _ in title_hits:
+        if len(query_key) >= SUBSTRING_MIN_LEN and query_key in contents_lower[idx]:
+            content_scores[idx] = 100.0
+        else:
+            fuzzy_contents[idx] = contents_lower[idx]
+    if fuzzy_contents:
+        content_hits = process.extract(query_lower, fuzzy_contents, scorer=fuzz.partial_ratio, limit=None)
+        content_scores.update((idx, c_score) for _, c_score, idx in content_hits)
+
+    results = []
+    for idx, t_score in title_hits:
+        final_score = t_score * 0.7 + content_scores[idx] * 0.3
+        if final_score > 40:
+            results.append((idx, final_score))
+    return sorted(results, key=lambda x: (-x[1], x[0]))
+
+
+def scored_sections(choices: Dict, query: str, top_k: int) -> Tuple[Tuple[int, float], ...]:
+    """Top (position in choices["items"], score) pairs for a query; never rebuilds the index"""
+    items, sub_topics = choices["items"], choices["sub_topics"]
+    if not items:
+        return ()
+
+    query_key = query.lower().strip()
+
+    results = []
+    title_matches = set()
+    if len(query_key) >= SUBSTRING_MIN_LEN:
+        # first tier: titles containing the query, scored over just those titles;
+        # when they fill top_k the fuzzy pass over every other title is skipped
+        title_matches = {idx for idx, item in enumerate(items) if query_key in item['sub_topic_lower']}
+        title_hits = process.extract(query, {idx: sub_topics[idx] for idx in sorted(title_matches)},
+                                     scorer=fuzz.WRatio, limit=None)
+        results = blended_scores(choices, query, [(idx, t_score) for _, t_score, idx in title_hits])
+        if len(results) >= top_k:
+            return tuple(results[:top_k])
+
+    candidates = {idx: sub_topic for idx, sub_topic in enumerate(sub_topics) if idx not in title_matches}
+    if candidates:
+        # a title below the cutoff can't pass 40 even with a perfect content score
+        title_hits = process.extract(query, candidates, scorer=fuzz.WRatio,
+                                     score_cutoff=(40 - 30) / 0.7, limit=None)
+        results += blended_scores(choices, query, [(idx, t_score) for _, t_score, idx in title_hits])
+
+    return tuple(sorted(results, key=lambda x: (-x[1], x[0]))[:top_k])
+
+
+def smart_search(query: str, main_filters: Optional[List[str]] = None, top_k: int = 3) -> List[Dict]:
+    """
+    Search logic returning internal Dictionary structure.
+    Increased top_k slightly to ensure context isn't missed.
+    Sections matching any of main_filters are scored in one pass, so results are unique.
+    """
+    filters = tuple(f.lower() for f in main_filters or ())
+    choices = get_search_choices(filters)  # one snapshot for both scoring and materializing
+    hits = choices["search"](query, top_k)
+    return [{**choices["items"][idx], "score": score} for idx, score in hits]
+
+
+def get_overview():
+    """
+    main_topic -> sorted unique sub_topics, plus its Markdown rendering.
+    Computed once per index build; returns (structure, markdown).
+    """
+    kb = build_knowledge_index()
+    if _overview_cache["kb"] is not kb:
+        structure = {}
+        for item in kb:
+            structure.setdefault(item['main_topic'], set()).add(item['sub_topic'])
+        structure = {main: sorted(subs) for main, subs in structure.items()}
+
+        md_lines = ["# Analytics Ecosystem Overview\n"]
+        for main, subs in structure.items():
+            md_lines.append(f"### {main}")
+            for sub in subs:
+                # Avoid repeating if subtopic is same as main topic
+                if sub and sub != main:
+                    md_lines.append(f"- {sub}")
+            md_lines.append("") # Empty line for spacing
+
+        _overview_cache.update(kb=kb, structure=structure, markdown="\n".join(md_lines))
+    return _overview_cache["structure"], _overview_cache["markdown"]
+
+
+# --- Helper: Format Output as Markdown ---
+def format_results_as_markdown(title: str, results: List[Dict], error_msg: str = "No info found.") -> str:
+    """
+    Converts search results into a clean Markdown string.
+    This reduces token usage and processing time for the LLM compared to JSON.
+    """
+    if not results:
+        return f"**Status**: {error_msg}\nQuery: {title}"
+
+    # one pre-formatted block per result, joined once at the end
+    md_blocks = [f"# Search Results for: '{title}'\n"]
+    for i, r in enumerate(results, 1):
+        # Truncate very long content if necessary to prevent timeouts
+        # 2000 chars is roughly 500-800 tokens, which is a safe chunk size per section
+        content = r['content']
+        if len(content) > 2000: 
+            content = content[:2000] + "\n...(content truncated due to length)..."
+        
+        md_blocks.append(f"## {i}. {r['main_topic']} > {r['sub_topic']}\n{content}\n\n---")
+    
+    return "\n".join(md_blocks)
+
+def parse_table_to_markdown(tbl) -> str:
+    """change Word table (<w:tbl> element) to Markdown format for LLM"""
+    rows = []
+    above = {}  # grid column -> text, repeated into vertically merged cells
+    for tr in tbl.iterfind("w:tr", NSMAP):
+        cells = []
+        for tc in tr.iterfind("w:tc", NSMAP):
+            span = tc.find("w:tcPr/w:gridSpan", NSMAP)
+            v_merge = tc.find("w:tcPr/w:vMerge", NSMAP)
+            if v_merge is not None and v_merge.get(W_VAL, "continue") == "continue":
+                text = above.get(len(cells), "")
+            else:
+                cell_text = "\n".join(paragraph_text(p) for p in tc.iterfind("w:p", NSMAP))
+                text = cell_text.strip().replace("\n", " ")
+            # horizontally merged cells repeat their text, as python-docx row.cells did
+            for _ in range(int(span.get(W_VAL)) if span is not None else 1):
+                above[len(cells)] = text
+                cells.append(text)
+        rows.append(cells)
+    return table_rows_to_markdown(rows)
+
+
+def table_rows_to_markdown(rows: List[List[str]]) -> str:
+    """Markdown table from rows of cell texts, the first row being the header"""
+    lines = []
+    for i, cells in enumerate(rows):
+        lines.append("| " + " | ".join(cells) + " |")
+        if i == 0: # header separator
+            lines.append("| " + " | ".join(["---"] * len(cells)) + " |")
+    return "\n" + "\n".join(lines) + "\n"
@@ -1,125 +1,16 @@
-import os
 import sys
+import asyncio
 import logging
-from typing import List, Dict, Optional
-from docx import Document
 from fastmcp import FastMCP
-from rapidfuzz import fuzz
+from arduino_core import build_knowledge_index, get_overview, smart_search, feedback_logger
 
 # --- Initialization ---
 logging.basicConfig(level=logging.INFO, stream=sys.stderr)
 logger = logging.getLogger(__name__)
 
 mcp = FastMCP("Arduino_Analytics_Expert")
-DOC_PATH = os.path.join(os.path.dirname(__file__), "Arduino - The Analytics Ecosytem playbook.docx")
+TOP_K = 2  # sections per search; fewer than the Markdown server to keep payloads small
 
-# _knowledge_index: List[Dict[str, Any]] = []
-
-_knowledge_index = None
-_last_mtime = None
-
-
-# --- Analysis functions ---
-
-def parse_table_to_markdown(table) -> str:
-    """change Word table to Markdown format for LLM"""
-    rows = []
-    for i, row in enumerate(table.rows):
-        cells = [cell.text.strip().replace("\n", " ") for cell in row.cells]
-        rows.append("| " + " | ".join(cells) + " |")
-        if i == 0: # header separator
-            rows.append("| " + " | ".join(["---"] * len(cells)) + " |")
-    return "\n" + "\n".join(rows) + "\n"
-
-def build_knowledge_index():
-    """Make index with Heading"""
-    global _knowledge_index, _last_mtime
-
-    if not os.path.exists(DOC_PATH):
-        logger.error(f"Document not found at {DOC_PATH}")
-        return []
-    
-    # check file modification time
-    mtime = os.path.getmtime(DOC_PATH)
-    if _knowledge_index is not None and _last_mtime == mtime:
-        return _knowledge_index  # cache valid
-
-    _last_mtime = mtime
-    _knowledge_index = []
-
-    doc = Document(DOC_PATH)
-    index = []
-    current_main_topic = "General Overview"
-    current_sub_topic = ""
-    current_content = []
-
-    # snapshot current section
-    def save_current_section():
-        if current_content:
-            text = "\n".join(current_content).strip()
-            if text:
-                index.append({
-                    "main_topic": current_main_topic,
-                    "sub_topic": current_sub_topic or current_main_topic,
-                    "content": text,
-                    "search_key": f"{current_main_topic} {current_sub_topic}".lower(),
-                    # "last_updated": mtime
-                })
-
-    for child in doc.element.body.iterchildren():
-        # <p> paragraph
-        if child.tag.endswith('p'):
-            para = [p for p in doc.paragraphs if p._element == child][0]
-            text = para.text.strip()
-            if not text: continue
-            
-            is_bold = para.runs[0].bold if para.runs else False
-            # Big title (Heading 1)
-            if para.style.name.startswith('Heading 1'):
-                save_current_section()
-                current_main_topic = text
-                current_sub_topic = ""
-                current_content = []
-            # Small title (Heading 2 or bold short line)
-            elif para.style.name.startswith('Heading') or (is_bold and len(text) < 60):
-                save_current_section()
-                current_sub_topic = text
-                current_content = []
-            else:
-                current_content.append(text)
-        
-        # <tbl> table
-        elif child.tag.endswith('tbl'):
-            table = [t for t in doc.tables if t._element == child][0]
-            current_content.append(parse_table_to_markdown(table))
-
-        # graph
-        elif child.findall('.//w:drawing', namespaces=doc.element.nsmap):
-            img_context = current_sub_topic or "Unlabeled Section"
-            current_content.append(f"\n> Graph in this section: {img_context}] (Please search in original document)\n")
-
-    save_current_section()
-    _knowledge_index = index
-    return _knowledge_index
-
-
-def smart_search(query: str, main_filter: Optional[str] = None, top_k: int = 2) -> List[Dict]:
-    kb = build_knowledge_index()
-    results = []
-    
-    for item in kb:
-        if main_filter and main_filter.lower() not in item['main_topic'].lower():
-            continue
-            
-        # score: title(70%) + content(30%)
-        t_score = fuzz.WRatio(query, item['sub_topic'])
-        c_score = fuzz.partial_ratio(query.lower(), item['content'].lower())
-        final_score = t_score * 0.7 + c_score * 0.3
-        
-        if final_score > 40:
-            results.append({**item, "score": final_score})
-            
-    return sorted(results, key=lambda x: x['score'], reverse=True)[:top_k] # top_k results: 2
 
 # --- MCP Tools ---
 @mcp.tool()
@@ -128,15 +19,11 @@ async def get_comprehensive_overview() -> dict:
     Provides a structural overview of the entire Analytics Ecosystem.
     Returns structured sections for Agent to build navigation or summary.
     """
-    kb = build_knowledge_index()
-    structure = {}
-    for item in kb:
-        structure.setdefault(item['main_topic'], []).append(item['sub_topic'])
-    
+    structure, _ = await asyncio.to_thread(get_overview)
     sections = [
         {
             "main_topic": main,
-            "sub_topics": list(set(subs))
+            "sub_topics": subs
         }
         for main, subs in structure.items()
     ]
@@ -154,7 +41,7 @@ async def solve_analytics_issue(query: str) -> dict:
     Search for solutions to specific problems, including discrepancies or implementation errors.
     Returns structured evidence for Agent to summarize or generate SOPs.
     """
-    results = smart_search(query)
+    results = await asyncio.to_thread(smart_search, query, top_k=TOP_K)
     if not results:
         return {
             "query": query,
@@ -184,8 +71,7 @@ async def check_limits_and_compliance(topic: str) -> dict:
     Query GA4 limits, data retention, cookie consent, or age restrictions.
     Returns structured evidence for Agent to summarize or generate instructions.
     """
-    results = smart_search(topic, main_filter="restrictions")
-    results += smart_search(topic, main_filter="limits")
+    results = await asyncio.to_thread(smart_search, topic, main_filters=["restrictions", "limits"], top_k=2 * TOP_K)
 
     if not results:
         return {"topic": topic, "sections": [], "message": "No compliance or limit information found."}
@@ -213,8 +99,7 @@ async def compare_platform_strategy(feature_or_tool: str) -> dict:
     Technical comparison between platforms (GA4, Segment, Shopify) and platform choice strategy.
     Returns structured evidence.
     """
-    results = smart_search(feature_or_tool, main_filter="choose")
-    results += smart_search(feature_or_tool, main_filter="discrepancies")
+    results = await asyncio.to_thread(smart_search, feature_or_tool, main_filters=["choose", "discrepancies"], top_k=2 * TOP_K)
 
     if not results:
         return {
@@ -246,11 +131,11 @@ async def get_metric_definition(term: str) -> dict:
     Best for answering 'What does X mean?'.
     """
     # Search in "Dimensions and Metrics" section first
-    results = smart_search(term, main_filter="Dimensions and Metrics")
+    results = await asyncio.to_thread(smart_search, term, main_filters=["Dimensions and Metrics"], top_k=TOP_K)
 
     # 2. If not found, try searching the full document for "Definition"
     if not results:
-        results = smart_search(term + " definition")
+        results = await asyncio.to_thread(smart_search, term + " definition", top_k=TOP_K)
 
     if not results:
         return {
@@ -282,8 +167,7 @@ async def report_documentation_issue(section_topic: str, issue_description: str)
     log_entry = f"[REPORT] Topic: {section_topic} | Issue: {issue_description}"
     logger.warning(log_entry)
     
-    with open("playbook_feedback.log", "a") as f:
-        f.write(log_entry + "\n")
+    feedback_logger.info(log_entry)
         
     return "Thank you. Your feedback has been logged and sent to the Data Governance team."
 